@@ -303,9 +303,9 @@ find_matching_map_file() {
     fi
 
     local candidates
-    candidates=$(ls -1t "$logs_dir"/*_realisations.map* 2>/dev/null || true)
+    candidates=$(ls -1t "$logs_dir"/*_realisations*.map* 2>/dev/null || true)
     if [[ -z "$candidates" ]]; then
-        debug "No *_realisations.map* files in '$logs_dir'"
+        debug "No *_realisations*.map* files in '$logs_dir'"
         echo ""
         return
     fi
@@ -0,0 +1,594 @@
+"""
+Shared core for the EMOD3D resource estimators (Cascade/ESNZ).
+
+The estimator scripts are thin wrappers that pick a sizing policy:
+  - "cybershake" (estimate_emod3d.py):
+      - Memory: Adds MPI overhead (1.5GB/task) to Grid Memory.
+      - Queue Strategy: Tries to fit job into < 350GB per node (Safe Zone),
+        increasing node count until this condition is met.
+  - "max10" (estimate_emod3d_max10nodes.py):
+      - Memory: Always ensures enough nodes to hold data.
+      - Compute: Throughput-Optimized Scaling. Start at min_nodes for memory and
+        only add nodes (up to 10) if simulated time > Max Walltime.
+
+Path resolution, YAML loading and their caches live here so every wrapper
+shares them.
+"""
+import sys
+import os
+import stat
+import json
+import math
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import PurePath
+
+# --- HARDWARE CONSTANTS ---
+PHYSICAL_CORES_PER_NODE = 192  # Cascade (Intel Sapphire Rapids)
+MAX_NODES_CAP = 10             # Strict cap due to Lustre I/O contention
+SLOPE = 1.9e-9                 # Tuned performance coefficient for Cascade (Intel Sapphire Rapids)
+
+# Policy: Max simulation walltime allowed before we force scaling up.
+# For Cybershake, we prefer letting it run longer on fewer nodes to reduce
+# queue wait time and total node-hours.
+DEFAULT_MAX_WALLTIME_HOURS = 24.0
+
+# --- "cybershake" POLICY ---
+# Heuristic: 31 * float4 * grid_points
+BYTES_PER_GRID_POINT = 4 * 31
+# Heuristic: MPI/OS Overhead per rank
+OVERHEAD_PER_TASK_GB = 1.5
+
+# Scheduling Thresholds
+# We lower this to 350GB. Even though nodes have 750GB,
+# the standard queue seems to reject/kill jobs > 450GB.
+SAFE_STANDARD_MEM_GB = 350.0
+# Hard limit for High Mem nodes
+SAFE_HIGH_MEM_GB = 730.0
+
+# --- "max10" POLICY ---
+RAM_PER_NODE_GB = 755.0        # Cascade High Mem
+REQUEST_RAM_GB = 735.0         # Safe margin for OS/Filesystem cache
+BASH_SCRIPT_OVERHEAD = 0.85    # Python/MPI overhead safety factor
+
+# Density Safety: If memory usage is very high, reduce tasks per node
+# to ensure we don't OOM due to MPI buffers.
+HIGH_DENSITY_THRESHOLD_GB = RAM_PER_NODE_GB * 0.85
+MIN_GB_PER_CORE_IF_FULL = 2.0
+
+# Derived once at import so the estimators only do per-fault math.
+USABLE_RAM_PER_NODE_GB = REQUEST_RAM_GB * BASH_SCRIPT_OVERHEAD
+SECONDS_PER_HOUR = 3600
+BYTES_PER_GB = 1024**3
+USABLE_RAM_PER_NODE_BYTES = int(USABLE_RAM_PER_NODE_GB * BYTES_PER_GB)
+
+def _exists(cache, path):
+    """os.path.exists() memoized in a caller-owned dict (valid for one short run)."""
+    if path not in cache: cache[path] = os.path.exists(path)
+    return cache[path]
+
+def find_project_root(start_path):
+    """Recursively find the project root containing 'Data' or 'Runs'."""
+    return _find_project_root(os.path.abspath(start_path))[0]
+
+@lru_cache(maxsize=256)
+def _find_project_root(abspath):
+    """
+    Returns (project_root, markers) where markers is the subset of {"Data", "Runs"}
+    present there, or (None, frozenset()). The same scandir that finds the root
+    answers which marker dirs exist, so callers skip probes under missing ones.
+    """
+    # One scandir per ancestor instead of two isdir() stats per level.
+    parts = abspath.split(os.sep)
+    for i in range(len(parts), 0, -1):
+        curr = os.sep.join(parts[:i]) or os.sep
+        try:
+            with os.scandir(curr) as it:
+                markers = frozenset(e.name for e in it if e.name in ("Data", "Runs") and e.is_dir())
+        except OSError:
+            continue
+        if markers: return curr, markers
+    return None, frozenset()
+
+def resolve_paths(input_arg, stat_cache=None):
+    """
+    Locates vm_params.yaml and root_params.yaml based on fault name or path.
+    Paths returned were confirmed to exist; they are recorded in stat_cache
+    (if given) so estimate() does not stat them again.
+    """
+    # Memoized per (input_arg, cwd) since relative inputs resolve against cwd.
+    vm_file, root_file = _resolve_paths(input_arg, os.getcwd())
+    if stat_cache is not None:
+        for path in (vm_file, root_file):
+            if path: stat_cache[path] = True
+    return vm_file, root_file
+
+@lru_cache(maxsize=64)
+def _vm_dir_names(project_root):
+    """Entry names under <project_root>/Data/VMs, listed once per process."""
+    try: return frozenset(os.listdir(os.path.join(project_root, "Data", "VMs")))
+    except OSError: return frozenset()
+
+@lru_cache(maxsize=256)
+def _resolve_paths(input_arg, cwd):
+    vm_file = None
+    root_file = None
+    fault_name = None
+    cache = {}
+
+    # Single stat of input_arg instead of separate exists/isfile/isdir calls.
+    try: st = os.stat(input_arg)
+    except OSError: st = None
+    exists = st is not None
+    is_file = exists and stat.S_ISREG(st.st_mode)
+    is_dir = exists and stat.S_ISDIR(st.st_mode)
+
+    # Check if direct file path
+    if exists: start_search = input_arg
+    else: start_search = cwd
+
+    if is_file and input_arg.endswith("yaml"):
+        vm_file = os.path.abspath(input_arg)
+        project_root, markers = _find_project_root(os.path.dirname(vm_file))
+        if "Runs" in markers:
+            candidate_root = os.path.join(project_root, "Runs", "root_params.yaml")
+            if _exists(cache, candidate_root): root_file = candidate_root
+        return vm_file, root_file
+
+    project_root, markers = _find_project_root(os.path.abspath(start_search))
+
+    # Check if fault name directory
+    if exists:
+        abspath = os.path.abspath(input_arg)
+        parts = PurePath(abspath).parts
+        # Fault name is the component right after the first "Runs" (single pass).
+        fault_name = next((parts[i+1] for i, p in enumerate(parts) if p == "Runs" and i + 1 < len(parts)), None)
+        if not fault_name:
+             fname_candidate = os.path.basename(abspath)
+             if "Data" in markers and fname_candidate in _vm_dir_names(project_root):
+                 fault_name = fname_candidate
+    else:
+        fault_name = input_arg
+
+    if fault_name and "Data" in markers:
+        # A listing of Data/VMs rules out unknown faults without stat'ing missing paths.
+        if os.sep in fault_name or fault_name in _vm_dir_names(project_root):
+            candidate = os.path.join(project_root, "Data", "VMs", fault_name, "vm_params.yaml")
+            if _exists(cache, candidate): vm_file = candidate
+    if "Runs" in markers:
+        candidate_root = os.path.join(project_root, "Runs", "root_params.yaml")
+        if _exists(cache, candidate_root): root_file = candidate_root
+
+    if not vm_file and is_dir:
+        local_vm = os.path.join(input_arg, "vm_params.yaml")
+        if _exists(cache, local_vm): vm_file = local_vm
+
+    return vm_file, root_file
+
+def _fast_yaml_load(path):
+    # Imported lazily: usage errors and JSON-sidecar hits never pay for PyYAML.
+    import yaml
+    # LibYAML C loader when available; pure-Python fallback otherwise.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    # Binary stream: LibYAML does the UTF-8 decode itself in C.
+    with open(path, 'rb') as f: return yaml.load(f, Loader=loader)
+
+def load_via_json_sidecar(path, mtime_ns, size):
+    """
+    Parsed YAML from <path>.json when the sidecar records exactly this
+    (mtime_ns, size) for the YAML, otherwise parses the YAML and (re)writes the
+    sidecar. "Sidecar is newer" is not enough: cp -p, rsync -a and mv keep a
+    replacement file's older mtime. The YAML stays the source of truth.
+    Shared with submit_emod3d_for_fault.py for its estimate files.
+    """
+    key = [mtime_ns, size]
+    sidecar = path + ".json"
+    try:
+        with open(sidecar, 'r') as f: cached = json.load(f)
+        if isinstance(cached, dict) and cached.get('mtime') == key: return cached['data']
+    except (OSError, ValueError, KeyError): pass
+
+    data = _fast_yaml_load(path)
+
+    # Best effort: read-only dirs or non-JSON types just skip the sidecar.
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w') as f: json.dump({'mtime': key, 'data': data}, f)
+        os.replace(tmp, sidecar)
+    except (OSError, TypeError, ValueError):
+        try: os.remove(tmp)
+        except OSError: pass
+    return data
+
+# Parsed YAML keyed by abspath -> (mtime_ns, size, data). Callers treat data as read-only.
+_YAML_CACHE = OrderedDict()
+_YAML_CACHE_MAX = 128
+
+def load_yaml_cached(path):
+    """Load a YAML file, reusing the previous parse if mtime and size are unchanged."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    cached = _YAML_CACHE.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        _YAML_CACHE.move_to_end(path)
+        return cached[2]
+
+    data = load_via_json_sidecar(path, st.st_mtime_ns, st.st_size)
+    _YAML_CACHE[path] = (st.st_mtime_ns, st.st_size, data)
+    _YAML_CACHE.move_to_end(path)
+    if len(_YAML_CACHE) > _YAML_CACHE_MAX: _YAML_CACHE.popitem(last=False)
+    return data
+
+# Top-level "dt: <number>" (optionally followed by a comment) in root_params.yaml.
+_DT_RE = re.compile(rb'^dt[ \t]*:[ \t]+([0-9.eE+-]+)[ \t]*(?:#.*)?$', re.MULTILINE)
+
+def _read_root_dt(path):
+    """dt from root_params.yaml, or None if the file has no top-level dt."""
+    st = os.stat(path)
+    return _scan_root_dt(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+@lru_cache(maxsize=128)
+def _scan_root_dt(path, mtime_ns, size):
+    # Only dt is needed from this (often large) file, so try a byte-level scan
+    # first and fall back to a full YAML parse for anything unusual.
+    with open(path, 'rb') as f: m = _DT_RE.search(f.read())
+    if m:
+        try: return float(m.group(1))
+        except ValueError: pass
+
+    root_data = load_yaml_cached(path)
+    return float(root_data['dt']) if 'dt' in root_data else None
+
+def _read_grid(vm_file, root_file, stat_cache):
+    """Returns ((nx, ny, nz, nt), None) or (None, error message)."""
+    if not vm_file or not _exists(stat_cache, vm_file):
+        return None, f"vm_params.yaml not found."
+
+    vm_data = load_yaml_cached(vm_file)
+
+    # Default dt for EMOD3D
+    dt = 0.005
+    if root_file and _exists(stat_cache, root_file):
+        root_dt = _read_root_dt(root_file)
+        if root_dt is not None: dt = root_dt
+    elif 'dt' in vm_data:
+        dt = float(vm_data['dt'])
+
+    try:
+        nx = int(vm_data['nx'])
+        ny = int(vm_data['ny'])
+        nz = int(vm_data['nz'])
+        if 'nt' in vm_data:
+            nt = int(vm_data['nt'])
+        elif 'sim_duration' in vm_data:
+            nt = int(float(vm_data['sim_duration']) / dt)
+        else:
+            return None, "Missing nt or sim_duration"
+    except KeyError as e:
+        return None, f"Missing param: {e}"
+
+    return (nx, ny, nz, nt), None
+
+def _grid_bytes(nx, ny, nz):
+    # Approximate memory footprint for EMOD3D
+    surface_term = max(nx*ny, ny*nz, nx*nz)
+    return 4 * (31 * nx * ny * nz + 56 * surface_term + 6 * (nx + nz))
+
+def _format_walltime(seconds):
+    h, r = divmod(seconds, 3600)
+    m, s = divmod(r, 60)
+    return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
+
+def _estimate_cybershake(nx, ny, nz, nt, max_walltime_hours):
+    # --- MEMORY CALCULATION ---
+    grid_bytes = _grid_bytes(nx, ny, nz)
+    grid_gb = grid_bytes / BYTES_PER_GB
+
+    V = grid_bytes * nt
+    max_sec = max_walltime_hours * SECONDS_PER_HOUR
+
+    # Loop invariants: every candidate runs full nodes, so only n varies.
+    work = SLOPE * V
+    tasks_per_node = PHYSICAL_CORES_PER_NODE
+
+    # Runtime falls monotonically with n, so jump straight to the first node
+    # count that meets max_sec (or the cap) instead of testing every n from 1.
+    # The nudges only absorb float rounding in ceil().
+    if max_sec > 0:
+        n_start = max(1, min(MAX_NODES_CAP, math.ceil(work / (max_sec * tasks_per_node))))
+    else:
+        n_start = MAX_NODES_CAP
+    while n_start > 1 and work / ((n_start - 1) * tasks_per_node) <= max_sec: n_start -= 1
+    while n_start < MAX_NODES_CAP and work / (n_start * tasks_per_node) > max_sec: n_start += 1
+
+    # Iterate from the first time-feasible count to Max Nodes to find best fit
+    best = None
+    for n in range(n_start, MAX_NODES_CAP + 1):
+        # Total Memory for this config = Grid + (Tasks * Overhead)
+        total_mem_gb = grid_gb + (n * tasks_per_node * OVERHEAD_PER_TASK_GB)
+        mem_per_node = total_mem_gb / n
+
+        # Check Time Constraint
+        total_cores = n * tasks_per_node
+        pred_sec = work / total_cores
+
+        # Classify Queue Suitability
+        # STRICTER: Only accept if < 350GB per node to ensure Standard Queue acceptance.
+        # Standard fits score n and high_mem fits 100 + n (heavy penalty, try to split
+        # instead), so scanning n upwards the first standard fit wins outright and
+        # otherwise the first high_mem fit is kept. No candidate list is needed.
+        if mem_per_node < SAFE_STANDARD_MEM_GB:
+            best = (n, pred_sec, mem_per_node, "standard")
+            break
+        if mem_per_node < SAFE_HIGH_MEM_GB and best is None:
+            best = (n, pred_sec, mem_per_node, "high_mem")
+
+    if best is None:
+        return None, "No valid configuration found (Job too large for available nodes)."
+
+    best_n, best_time, best_mem_per_node, best_queue = best
+
+    # --- FINAL REQUEST CALCULATION ---
+    # Add 20% buffer
+    req_mem_per_node = best_mem_per_node * 1.20
+
+    if best_queue == 'standard':
+        # Ensure we request at least what we calculated, but don't ask for the full node (700)
+        # if we only need 350. Asking for 700 might trigger the hidden queue rejection.
+        # We cap the request at 450GB for standard queue.
+        req_mem_per_node = max(req_mem_per_node, 100.0) # Min 100GB
+        req_mem_per_node = min(req_mem_per_node, 450.0)
+    else:
+        # High Mem: Cap at 730GB
+        req_mem_per_node = min(req_mem_per_node, SAFE_HIGH_MEM_GB)
+
+    total_req_gb = int(req_mem_per_node * best_n)
+
+    # Time Buffer
+    req_walltime_sec = int(best_time * 1.5 + 1200)
+
+    return {
+        "nodes": best_n,
+        "tasks_per_node": tasks_per_node,
+        "mem_gb": total_req_gb,
+        "walltime": _format_walltime(req_walltime_sec),
+        "est_hours": best_time / SECONDS_PER_HOUR,
+        "mem_model_grid": grid_gb,
+        "mem_model_overhead": (best_n * tasks_per_node * OVERHEAD_PER_TASK_GB),
+        "queue_type": best_queue
+    }, None
+
+def _config_for_nodes(n, M_gb_needed, work):
+    """Returns (tasks_per_node, predicted_seconds) for a run on n nodes."""
+    mem_per_node = M_gb_needed / n
+
+    # Density Check: If node is very full, reduce tasks per node slightly to leave breathing room
+    tasks_per_node = PHYSICAL_CORES_PER_NODE
+    if mem_per_node > HIGH_DENSITY_THRESHOLD_GB:
+         max_safe_tasks = int(mem_per_node / MIN_GB_PER_CORE_IF_FULL)
+         tasks_per_node = min(PHYSICAL_CORES_PER_NODE, max_safe_tasks)
+         if tasks_per_node < 1: tasks_per_node = 1
+
+    return tasks_per_node, work / (n * tasks_per_node)
+
+def _solve_max10(min_nodes_mem, M_gb_needed, work, max_sec):
+    """
+    Pure scalar solver: returns (nodes, tasks_per_node, predicted_seconds).
+    Start checking from the minimum node count required for RAM and only
+    increase node count if the walltime exceeds our allowed limit.
+    """
+    # Runtime falls monotonically with n, so solve for n directly rather than
+    # stepping through every candidate; the nudges below only absorb float
+    # rounding in ceil() and the density clamp.
+    if max_sec > 0:
+        n_time = math.ceil(work / (max_sec * PHYSICAL_CORES_PER_NODE))
+    else:
+        n_time = MAX_NODES_CAP
+    n = max(min_nodes_mem, min(MAX_NODES_CAP, n_time))
+
+    while n > min_nodes_mem and _config_for_nodes(n - 1, M_gb_needed, work)[1] <= max_sec:
+        n -= 1
+
+    # If nothing fits we accept the best we can do at MAX_NODES_CAP.
+    tasks_per_node, pred_sec = _config_for_nodes(n, M_gb_needed, work)
+    while pred_sec > max_sec and n < MAX_NODES_CAP:
+        n += 1
+        tasks_per_node, pred_sec = _config_for_nodes(n, M_gb_needed, work)
+
+    return n, tasks_per_node, pred_sec
+
+def _estimate_max10(nx, ny, nz, nt, max_walltime_hours):
+    # --- CONSTANTS & CALCS ---
+    M_bytes = _grid_bytes(nx, ny, nz)
+    M_gb_needed = M_bytes / BYTES_PER_GB
+
+    # Computational Volume (scaled by the SLOPE performance coefficient)
+    V = M_bytes * nt
+    max_sec = max_walltime_hours * SECONDS_PER_HOUR
+
+    # --- 1. MINIMUM NODES (Memory Constraint) ---
+    # Integer ceil-div on bytes: no float round-trip for the node count.
+    min_nodes_mem = -(-M_bytes // USABLE_RAM_PER_NODE_BYTES)
+
+    if min_nodes_mem > MAX_NODES_CAP:
+        # We cap at MAX_NODES_CAP even if memory is insufficient,
+        # but we warn loudly. This prevents the estimator from returning > 10.
+        print(f"WARNING: Job technically needs {min_nodes_mem} nodes for RAM ({M_gb_needed:.2f}GB), but capped at {MAX_NODES_CAP}. Job may OOM.")
+        min_nodes_mem = MAX_NODES_CAP
+
+    if min_nodes_mem < 1: min_nodes_mem = 1
+
+    # --- 2. THROUGHPUT SOLVER (Time Constraint) ---
+    best_n, best_tasks, best_time = _solve_max10(min_nodes_mem, M_gb_needed, SLOPE * V, max_sec)
+
+    # --- 3. OUTPUT ---
+    req_mem_gb = int(REQUEST_RAM_GB)
+
+    # Pad walltime: 20% + 10 minutes safety
+    req_walltime_sec = int(best_time * 1.2 + 600)
+
+    return {
+        "nodes": best_n,
+        "tasks_per_node": best_tasks,
+        "mem_gb": req_mem_gb,
+        "walltime": _format_walltime(req_walltime_sec),
+        "est_hours": best_time / SECONDS_PER_HOUR,
+        "mem_needed_total": M_gb_needed
+    }, None
+
+POLICIES = {
+    "cybershake": _estimate_cybershake,
+    "max10": _estimate_max10,
+}
+
+def estimate(vm_file, root_file, policy, max_walltime_hours=DEFAULT_MAX_WALLTIME_HOURS, stat_cache=None):
+    """Returns (result_dict, None) or (None, error message) for the given sizing policy."""
+    if stat_cache is None: stat_cache = {}
+    grid, err = _read_grid(vm_file, root_file, stat_cache)
+    if err: return None, err
+    return POLICIES[policy](*grid, max_walltime_hours)
+
+def _print_debug(policy, res):
+    # Debug info to stderr so it doesn't break shell sourcing
+    if policy == "cybershake":
+        print(f"DEBUG: Grid: {res['mem_model_grid']:.1f}GB + Overhead: {res['mem_model_overhead']:.1f}GB", file=sys.stderr)
+        print(f"DEBUG: Est. Per Node: {res['mem_gb']/res['nodes']:.1f} GB (Target: {res['queue_type']})", file=sys.stderr)
+    else:
+        print(f"DEBUG: Total Mem Needed: {res['mem_needed_total']:.2f} GB", file=sys.stderr)
+        print(f"DEBUG: Est. Runtime: {res['est_hours']:.2f} h", file=sys.stderr)
+
+def run_batch(policy, max_walltime_hours, lines):
+    """
+    Estimates every fault name/path in lines (one per line) in this process,
+    printing one shell-evaluable line per fault. Returns the number of failures.
+    """
+    # Imported here: the per-fault CLI and in-process callers never need them.
+    import contextlib
+    import shlex
+    stat_cache = {}
+    failures = 0
+    for line in lines:
+        fault = line.strip()
+        if not fault: continue
+
+        vm_file, root_file = resolve_paths(fault, stat_cache)
+        # Policy warnings go to stderr so stdout stays one line per fault.
+        with contextlib.redirect_stdout(sys.stderr):
+            res, err = estimate(vm_file, root_file, policy, max_walltime_hours, stat_cache)
+
+        if err:
+            failures += 1
+            print(f"FAULT={shlex.quote(fault)} ERROR={shlex.quote(err)}")
+            continue
+        print(f"FAULT={shlex.quote(fault)} NODES={res['nodes']} TASKS_PER_NODE={res['tasks_per_node']} "
+              f"MEM_PER_NODE={res['mem_gb']}gb WALLTIME={res['walltime']}")
+    return failures
+
+def _shell_vars(res):
+    """The shell-sourceable KEY=VALUE lines the CLI prints for a result."""
+    return [
+        f"NODES={res['nodes']}",
+        f"TASKS_PER_NODE={res['tasks_per_node']}",
+        f"MEM_PER_NODE={res['mem_gb']}gb",
+        f"WALLTIME={res['walltime']}",
+    ]
+
+def default_socket_path():
+    import tempfile
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, "emod3d_estimator.sock")
+
+def serve_daemon(policy, socket_path):
+    """
+    Answers estimates over a Unix socket so shell loops skip interpreter startup
+    and reuse the parsed-YAML and path caches across requests.
+
+    Protocol: the client sends one line '<FaultName_or_Path> [max_walltime_hours]'
+    and reads back the same KEY=VALUE lines the CLI prints, or ERROR=<quoted msg>.
+    Relative fault names resolve against the daemon's working directory.
+    """
+    # Imported here: only --daemon uses them.
+    import contextlib
+    import shlex
+    import signal
+    import socket
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            fields = self.rfile.readline().decode(errors="replace").split()
+            try:
+                if not fields: raise ValueError("empty request")
+                target_val = float(fields[1]) if len(fields) > 1 else DEFAULT_MAX_WALLTIME_HOURS
+                vm_file, root_file = resolve_paths(fields[0])
+                # Don't let a miss stick: the fault may be created later.
+                if not vm_file:
+                    _resolve_paths.cache_clear()
+                    _vm_dir_names.cache_clear()
+                with contextlib.redirect_stdout(sys.stderr):
+                    res, err = estimate(vm_file, root_file, policy, target_val)
+            except ValueError as e:
+                res, err = None, str(e)
+
+            lines = [f"ERROR={shlex.quote(err)}"] if err else _shell_vars(res)
+            # A client may hang up without reading, e.g. another daemon's liveness probe.
+            try: self.wfile.write(("\n".join(lines) + "\n").encode())
+            except BrokenPipeError: pass
+
+    # A leftover socket from a dead daemon would make bind() fail. Only that is
+    # removed: never a regular file (a typo'd path), never a live daemon's socket.
+    try: st = os.lstat(socket_path)
+    except FileNotFoundError: st = None
+    if st is not None:
+        if not stat.S_ISSOCK(st.st_mode):
+            print(f"Error: {socket_path} exists and is not a socket", file=sys.stderr)
+            sys.exit(1)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try: probe.connect(socket_path)
+            except ConnectionRefusedError: os.unlink(socket_path)
+            else:
+                print(f"Error: an estimator daemon is already listening on {socket_path}", file=sys.stderr)
+                sys.exit(1)
+
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        print(f"Estimator daemon ({policy}) listening on {socket_path}", file=sys.stderr)
+        # Exit cleanly on kill so the socket file is removed below.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try: os.unlink(socket_path)
+            except OSError: pass
+
+def main(policy):
+    if len(sys.argv) < 2:
+        print("Usage: python3 estimate_emod3d.py <FaultName_or_Path> [max_walltime_hours]")
+        print("       python3 estimate_emod3d.py --batch [max_walltime_hours] < fault_list")
+        print("       python3 estimate_emod3d.py --daemon [socket_path]")
+        sys.exit(1)
+
+    input_arg = sys.argv[1]
+    if input_arg == "--daemon":
+        serve_daemon(policy, sys.argv[2] if len(sys.argv) > 2 else default_socket_path())
+        return
+
+    # Allow overriding default 24h limit via command line
+    target_val = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MAX_WALLTIME_HOURS
+
+    if input_arg == "--batch":
+        sys.exit(1 if run_batch(policy, target_val, sys.stdin) else 0)
+
+    stat_cache = {}
+    vm_file, root_file = resolve_paths(input_arg, stat_cache)
+    res, err = estimate(vm_file, root_file, policy, target_val, stat_cache)
+
+    if err:
+        print(f"Error: {err}")
+        sys.exit(1)
+
+    # Printing shell-sourceable output
+    print("\n".join(_shell_vars(res)))
+    _print_debug(policy, res)
@@ -143,7 +143,7 @@ for rel_dir in $ALL_DIRS; do
 
     # Step 1: Check Rlog for "FINISHED" in last line
     # Find the latest rlog file
-    rlog_file=$(find "$rlog_dir" -name "*.rlog" -print0 | xargs -0 ls -t 2>/dev/null | head -n 1)
+    rlog_file=$(find "$rlog_dir" -type f -name "*.rlog" -print0 | xargs -0 ls -t 2>/dev/null | head -n 1)
 
     if [[ -z "$rlog_file" ]]; then
         echo "  [ERROR] No .rlog file found in $rlog_dir"
@@ -3,24 +3,42 @@
 submit_emod3d_for_fault.py
 
 Updates:
-  - Uses the unified, intelligent estimator (estimate_emod3d.py).
+  - Uses the unified, intelligent estimator (estimate_emod3d.py), in-process via estimator_core when available.
   - Uses central EMOD3D binary.
   - Ensures memory is calculated correctly for array jobs.
   - Lists targets explicitly.
   - Queue threshold restored to 700GB (matching 750GB hardware).
   - Updates logic for --force to skip COMPLETED jobs and ask for confirmation on IN_PROGRESS jobs.
   - Displays 'nt' from rlog and allows updating walltime interactively.
+  - --fault-list submits ALL realisations of many faults with as few qsub calls as possible.
 """
 
 import argparse
+import copy
 import os
 import sys
 import subprocess
+import tempfile
 import yaml
-import glob
 import shutil
-import math
 import datetime
+import json
+import re
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try: from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError: from yaml import SafeLoader, SafeDumper
+
+# The estimator normally sits next to this script; when it does, estimates run
+# in-process instead of forking python3 for estimate_emod3d.py, with the policy
+# taken from that shim so the two paths cannot drift apart.
+try:
+    import estimator_core
+    from estimate_emod3d import POLICY as ESTIMATE_POLICY
+except ImportError:
+    estimator_core = None
 
 # --- CONFIGURATION ---
 SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -30,170 +48,364 @@ MASTER_PBS_SCRIPT = os.path.join(SCRIPTS_DIR, "run_emod3d.pbs")
 
 EMOD3D_BIN = "/uoc/project/uoc40001/EMOD3D/tools/emod3d-mpi_v3.0.8"
 DEFAULTS_YAML_NAME = "emod3d_defaults.yaml"
-
-def resolve_paths(fault_name):
-    cwd = os.getcwd()
-    runs_root = None
-    if "Runs" in cwd:
-        parts = cwd.split("Runs")
-        runs_root = parts[0] + "Runs"
-    elif os.path.isdir(os.path.join(cwd, "Runs")):
-        runs_root = os.path.join(cwd, "Runs")
-    else:
-        if os.path.isdir(os.path.join(cwd, fault_name)):
-            runs_root = cwd
-        else:
-             print(f"Error: Could not determine 'Runs' root directory from {cwd}")
-             sys.exit(1)
-
-    fault_dir = os.path.join(runs_root, fault_name)
-    if not os.path.isdir(fault_dir):
-        print(f"Error: Could not locate fault directory: {fault_dir}")
+RLOG_SUBDIR = "LF/Rlog"  # Per-realisation rlog dir; paths are built as f"{dir}/..." (POSIX-only cluster)
+LOGS_DIR_NAME = "Logs_Submission"
+LATEST_RLOG_LINK = ".latest_rlog"  # Symlink to the newest rlog, left in RLOG_SUBDIR by run_emod3d.pbs (deliberately not *.rlog)
+DONE_SENTINEL = ".emod3d_done"  # Touched by run_emod3d.pbs when EMOD3D exits cleanly
+STATUS_MANIFEST_NAME = "status.jsonl"  # Appended by run_emod3d.pbs under <fault>/Logs_Submission
+RLOG_TAIL_BYTES = 8192  # Roughly the last 50 lines of an rlog
+RLOG_HEAD_BYTES = 65536  # Covers the parameter dump at the top of an rlog (where nt= is)
+QSUB_WORKERS = 4  # Concurrent qsub calls for --fault-list; keeps load on the PBS server modest
+STATUS_WORKERS = 32  # Rlog checks are filesystem-latency bound (Lustre/NFS)
+MODES = ("MEDIAN", "ALL")  # Optional trailing positional after the fault name(s)
+
+def find_runs_root(cwd, fault_name):
+    """The Runs root for cwd; fault_name is only probed when cwd has no Runs dir in or under it."""
+    # String match first: inside the Runs tree no stat is needed to find the root.
+    idx = cwd.find("Runs")
+    if idx >= 0: return cwd[:idx] + "Runs"
+    if os.path.isdir(os.path.join(cwd, "Runs")): return os.path.join(cwd, "Runs")
+    if os.path.isdir(os.path.join(cwd, fault_name)): return cwd
+    print(f"Error: Could not determine 'Runs' root directory from {cwd}")
+    sys.exit(1)
+
+def resolve_faults(fault_names):
+    """
+    (runs_root, [(fault_name, fault_dir), ...]) with the Runs root found once and
+    every fault checked against a single listing of it. Unknown faults are
+    reported and left out; callers exit before submitting if any are missing.
+    """
+    runs_root = find_runs_root(os.getcwd(), fault_names[0])
+    try:
+        with os.scandir(runs_root) as it: existing = {e.name for e in it if e.is_dir()}
+    except OSError:
+        existing = set()
+
+    found = []
+    for fault_name in fault_names:
+        fault_dir = f"{runs_root}/{fault_name}"
+        if fault_name in existing: found.append((fault_name, fault_dir))
+        else: print(f"Error: Could not locate fault directory: {fault_dir}")
+    return runs_root, found
+
+@lru_cache(maxsize=None)
+def get_defaults_file(runs_root):
+    """<project>/emod3d_defaults.yaml for a Runs root, checked once; exits if missing."""
+    defaults_file = os.path.join(os.path.dirname(runs_root), DEFAULTS_YAML_NAME)
+    if not os.path.exists(defaults_file):
+        print(f"CRITICAL ERROR: Defaults file missing: {defaults_file}")
         sys.exit(1)
-
-    return fault_dir, runs_root
+    return defaults_file
 
 def sanitize_params(params):
+    seconds = None
     if 'walltime' in params and isinstance(params['walltime'], int):
+        seconds = params['walltime']
         h, r = divmod(params['walltime'], 3600)
         m, s = divmod(r, 60)
         params['walltime'] = f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
     
     params['walltime'] = str(params['walltime'])
-    return params
 
-def get_queue_name(total_mem_gb, walltime_str, nodes):
-    if isinstance(walltime_str, int):
-        h, r = divmod(walltime_str, 3600)
-        m, s = divmod(r, 60)
-        walltime_str = f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
+    # Hand-written YAML may quote numbers; coerce once so the submit path can do plain arithmetic.
+    for key in ('nodes', 'tasks_per_node'):
+        if key in params: params[key] = int(params[key])
+    mem = params.get('mem_gb')
+    if isinstance(mem, str): params['mem_gb'] = int(mem) if mem.strip().isdigit() else float(mem)
 
-    try:
-        parts = list(map(int, walltime_str.split(':')))
-        if len(parts) == 3: h, m, s = parts
-        elif len(parts) == 2: h, m, s = parts[0], parts[1], 0
-        else: h, m, s = parts[0], 0, 0
-    except ValueError:
-        return "shortq"
+    # Parsed once here so queue selection works on ints. Keys starting with '_'
+    # are runtime-only and never written back to the estimate YAML.
+    params['_walltime_seconds'] = seconds if seconds is not None else walltime_to_seconds(params['walltime'])
+    return params
 
-    total_seconds = h * 3600 + m * 60 + s
-    SECONDS_48H = 48 * 3600
+def set_walltime(params, walltime_str):
+    """Updates an already-sanitized params dict in place; no full sanitize_params pass."""
+    params['walltime'] = walltime_str
+    params['_walltime_seconds'] = walltime_to_seconds(walltime_str)
+    return params
 
+# HH:MM:SS, HH:MM or HH
+_WALL_RE = re.compile(r'^\s*(\d+)(?::(\d+))?(?::(\d+))?\s*$')
+
+@lru_cache(maxsize=256)
+def walltime_to_seconds(walltime_str):
+    """HH:MM:SS (or HH:MM, HH) -> seconds, or None if unparseable."""
+    m = _WALL_RE.match(walltime_str)
+    if not m: return None
+    h, mi, s = (int(g) if g else 0 for g in m.groups())
+    return h * 3600 + mi * 60 + s
+
+def load_yaml_params(path):
+    """Estimate params from a YAML file; YAML may have turned walltime into an int."""
+    return sanitize_params(load_estimate(path))
+
+# 700GB Threshold (Assuming 750GB Nodes)
+LIMIT_HIGH_MEM_PER_NODE = 700000
+SECONDS_48H = 48 * 3600
+
+# (high memory per node, longer than 48h) -> queue
+_QUEUE_TABLE = {
+    (False, False): "shortq",
+    (False, True): "longq",
+    (True, False): "high_mem_shortq",
+    (True, True): "high_mem_longq",
+}
+
+def get_queue_name(total_mem_gb, total_seconds, nodes):
+    if total_seconds is None: return "shortq"
     mem_per_node_mb = (total_mem_gb * 1024) / nodes
-    
-    # 700GB Threshold (Assuming 750GB Nodes)
-    LIMIT_HIGH_MEM_PER_NODE = 700000 
-
-    if mem_per_node_mb > LIMIT_HIGH_MEM_PER_NODE:
-        return "high_mem_longq" if total_seconds > SECONDS_48H else "high_mem_shortq"
-    else:
-        return "longq" if total_seconds > SECONDS_48H else "shortq"
+    return _QUEUE_TABLE[(mem_per_node_mb > LIMIT_HIGH_MEM_PER_NODE, total_seconds > SECONDS_48H)]
+
+# KEY=VALUE lines emitted by the estimator (NODES, TASKS_PER_NODE, MEM_PER_NODE, WALLTIME).
+_KV_RE = re.compile(r'^(\w+)\s*=\s*(\S.*?)\s*$', re.M)
+_NUM_RE = re.compile(r'\d+')
+# Rlog markers, matched on raw bytes: completion line, and e.g. "                    nt= 21639"
+_FINISHED_MARKER = b"PROGRAM emod3d-mpi IS FINISHED"
+_NT_RE = re.compile(rb'nt=\s*(\d+)(?!\S)')
+
+@lru_cache(maxsize=None)
+def static_path_exists(path):
+    """exists() for inputs that do not change during a run (e.g. the estimator script)."""
+    return os.path.exists(path)
+
+def run_estimator_in_process(fault_name):
+    """Same result as estimate_emod3d.py <fault_name>, as the dict exec_estimation_script builds from its output."""
+    vm_file, root_file = estimator_core.resolve_paths(fault_name)
+    res, err = estimator_core.estimate(vm_file, root_file, ESTIMATE_POLICY)
+    if err:
+        print(f"Error executing estimation script:\nError: {err}")
+        sys.exit(1)
+    return {
+        "NODES": str(res['nodes']),
+        "TASKS_PER_NODE": str(res['tasks_per_node']),
+        "MEM_PER_NODE": f"{res['mem_gb']}gb",
+        "WALLTIME": res['walltime'],
+    }
 
-def exec_estimation_script(fault_name):
+def run_estimator_subprocess(fault_name):
+    """KEY=VALUE pairs printed by estimate_emod3d.py <fault_name>."""
     script_path = ESTIMATE_SCRIPT
-    if not os.path.exists(script_path):
+    if not static_path_exists(script_path):
         print(f"  [ERROR] Estimator script not found at {script_path}")
         sys.exit(1)
 
-    print(f"→ Running intelligent resource estimation for {fault_name}...")
-    
     cmd = ["python3", script_path, fault_name]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing estimation script:\n{e.stderr}")
-        sys.exit(1)
-
+    # Parse stdout line by line as it arrives; stderr goes to a temp file so a
+    # chatty estimator can never block on a full pipe while we read stdout.
     data = {}
-    for line in result.stdout.splitlines():
-        if "=" in line:
-            key, val = line.split("=", 1)
-            data[key.strip()] = val.strip()
+    with tempfile.TemporaryFile(mode='w+') as err:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True, bufsize=1)
+        with p.stdout:
+            for line in p.stdout:
+                m = _KV_RE.match(line)
+                if m: data[m.group(1)] = m.group(2)
+        if p.wait():
+            err.seek(0)
+            print(f"Error executing estimation script:\n{err.read()}")
+            sys.exit(1)
+    return data
+
+def inputs_mtime(fault_name):
+    """
+    Newest mtime (ns) of the estimator's inputs (vm_params/root_params), or None
+    unless both resolve: a VM cleaned off scratch must not look like a change.
+    """
+    if estimator_core is None: return None
+    paths = estimator_core.resolve_paths(fault_name)
+    if not all(paths): return None
+    try: return max(os.stat(p).st_mtime_ns for p in paths)
+    except OSError: return None
 
+def exec_estimation_script(fault_name):
+    print(f"→ Running intelligent resource estimation for {fault_name}...")
+
+    if estimator_core is not None: data = run_estimator_in_process(fault_name)
+    else: data = run_estimator_subprocess(fault_name)
+
+    m = _NUM_RE.search(data.get("MEM_PER_NODE", "735"))
     yaml_data = {
         "nodes": int(data.get("NODES", 1)),
         "tasks_per_node": int(data.get("TASKS_PER_NODE", 1)),
-        "mem_gb": int(''.join(filter(str.isdigit, data.get("MEM_PER_NODE", "735")))),
+        "mem_gb": int(m.group()) if m else 735,
         "walltime": data.get("WALLTIME", "01:00:00")
     }
+    # Already strings from the estimator, so no sanitize_params pass is needed.
+    yaml_data["_walltime_seconds"] = walltime_to_seconds(yaml_data["walltime"])
+    source_mtime = inputs_mtime(fault_name)
+    if source_mtime is not None: yaml_data["source_mtime"] = source_mtime
     return yaml_data
 
+def dump_flat_yaml(data):
+    """
+    YAML text for a flat dict of int/str values (what an estimate holds), written
+    directly; anything else goes through yaml.dump. Strings are emitted as JSON
+    strings, which are valid double-quoted YAML and never re-read as sexagesimal ints.
+    """
+    if all(isinstance(v, str) or (isinstance(v, int) and not isinstance(v, bool)) for v in data.values()):
+        return "".join(f"{k}: {json.dumps(v) if isinstance(v, str) else v}\n" for k, v in sorted(data.items()))
+    return yaml.dump(data, Dumper=SafeDumper)
+
 def save_estimation_yaml(yaml_data, output_yaml):
-    with open(output_yaml, 'w') as f: yaml.dump(yaml_data, f)
+    saved = {k: v for k, v in yaml_data.items() if not k.startswith('_')}
+    atomic_write(output_yaml, dump_flat_yaml(saved))
     print(f"  ✓ Saved estimate to: {output_yaml}")
     print(f"    (Nodes: {yaml_data['nodes']}, Tasks: {yaml_data['tasks_per_node']}, Total Mem: {yaml_data['mem_gb']}GB, Time: {yaml_data['walltime']})")
 
-def get_run_status(run_dir):
-    rlog_dir = os.path.join(run_dir, "LF", "Rlog")
-    if not os.path.isdir(rlog_dir): return "NEW"
-    rlogs = glob.glob(os.path.join(rlog_dir, "*.rlog"))
-    if not rlogs: return "NEW"
-    latest_rlog = max(rlogs, key=os.path.getmtime)
+def load_estimate(path):
+    """
+    Loads an estimate YAML via estimator_core's <path>.json sidecar (keyed by the
+    YAML's exact mtime/size); without estimator_core the YAML is parsed directly.
+    Returns a fresh copy each call since callers (sanitize_params) mutate it.
+    """
+    st = os.stat(path)
+    return copy.deepcopy(_load_estimate_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size))
+
+# In-process memo on top of the sidecar: --fault-list with --est-yaml reads the same file per fault.
+@lru_cache(maxsize=64)
+def _load_estimate_cached(path, mtime_ns, size):
+    if estimator_core is not None: return estimator_core.load_via_json_sidecar(path, mtime_ns, size)
+    with open(path, 'r') as f: return yaml.load(f, Loader=SafeLoader)
+
+def find_latest_rlog(run_dir):
+    """(path, stat_result) of the newest RLOG_SUBDIR/*.rlog for a run dir, or None."""
+    rlog_dir = f"{run_dir}/{RLOG_SUBDIR}"
+    # run_emod3d.pbs points LATEST_RLOG_LINK at the newest rlog once EMOD3D exits,
+    # so finished or failed runs need one readlink + stat instead of a listing.
+    try:
+        path = os.path.join(rlog_dir, os.readlink(f"{rlog_dir}/{LATEST_RLOG_LINK}"))
+        return path, os.stat(path)
+    except OSError: pass
+    try:
+        with os.scandir(rlog_dir) as it:
+            newest = max((e for e in it if e.name.endswith(".rlog") and not e.name.startswith(".")),
+                         key=lambda e: e.stat().st_mtime, default=None)
+    except OSError:
+        return None
+    return (newest.path, newest.stat()) if newest else None
+
+def inspect_run(run_dir, details=True):
+    """
+    One pass over a run's newest rlog. Returns
+    (status, rlog_path, formatted_timestamp, last_5_lines_list, nt_value);
+    status is NEW, IN_PROGRESS or COMPLETED and the rlog fields are None/[] if
+    there is no rlog. nt is only looked up for IN_PROGRESS runs when details is set.
+    """
+    # run_emod3d.pbs touches the sentinel on success; one stat instead of reading the rlog.
+    # Runs from before the sentinel existed fall through to the rlog check, as do
+    # runs whose LF/ was wiped for a rerun (the sentinel sits outside LF/).
+    if os.path.exists(f"{run_dir}/{DONE_SENTINEL}") and os.path.isdir(f"{run_dir}/{RLOG_SUBDIR}"):
+        return "COMPLETED", None, None, [], None
+
+    newest = find_latest_rlog(run_dir)
+    if newest is None: return "NEW", None, None, [], None
+    rlog, st = newest
 
-    is_finished = False
     try:
-        with open(latest_rlog, 'r') as f:
-            lines = f.readlines()[-50:]
-            for line in lines:
-                if "PROGRAM emod3d-mpi IS FINISHED" in line:
-                    is_finished = True
-                    break
-    except Exception: pass
+        ts_str = datetime.datetime.fromtimestamp(st.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+        with open(rlog, 'rb') as f:
+            # The finish sentinel and the displayed tail are both in the last lines.
+            f.seek(max(0, st.st_size - RLOG_TAIL_BYTES))
+            chunk = f.read()
+            tail = [l.rstrip().decode('utf-8', 'replace') for l in chunk.splitlines()[-5:]]
+            if _FINISHED_MARKER in chunk:
+                return "COMPLETED", rlog, ts_str, tail, None
+
+            nt_val = None
+            if details:
+                # nt is printed in the parameter dump near the top; bound the read
+                # to the head of the file (then the tail we already have).
+                f.seek(0)
+                m = _NT_RE.search(f.read(RLOG_HEAD_BYTES)) or _NT_RE.search(chunk)
+                if m: nt_val = m.group(1).decode()
+
+        return "IN_PROGRESS", rlog, ts_str, tail, nt_val
+    except Exception as e:
+        return "IN_PROGRESS", rlog, "Unknown", [f"Error reading file: {e}"], None
 
-    return "COMPLETED" if is_finished else "IN_PROGRESS"
+def get_run_status(run_dir):
+    return inspect_run(run_dir, details=False)[0]
 
-def get_rlog_details(run_dir):
+def load_status_manifest(fault_dir):
     """
-    Returns tuple (filepath, formatted_timestamp, last_5_lines_list, nt_value)
-    or (None, None, [], None) if no rlog found.
+    {realisation basename: state} from Logs_Submission/status.jsonl, which
+    run_emod3d.pbs appends to (STARTED, then COMPLETED on success). The last
+    entry per dir wins; a missing or unreadable manifest gives {}.
+
+    To rerun a completed realisation without wiping LF/Rlog, remove its
+    .emod3d_done and append an entry with any other state, e.g.
+      echo '{"dir": "<rel_dir>", "state": "RESET"}' >> Logs_Submission/status.jsonl
+    (A realisation whose LF/Rlog is gone is treated as NEW regardless.)
     """
-    rlog_dir = os.path.join(run_dir, "LF", "Rlog")
-    if not os.path.isdir(rlog_dir): return None, None, [], None
-    rlogs = glob.glob(os.path.join(rlog_dir, "*.rlog"))
-    if not rlogs: return None, None, [], None
-    
-    latest_rlog = max(rlogs, key=os.path.getmtime)
-    nt_val = None
-
+    states = {}
     try:
-        mtime = os.path.getmtime(latest_rlog)
-        ts_str = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-        
-        with open(latest_rlog, 'r', errors='replace') as f:
-            lines = f.readlines()
-            tail = [l.rstrip() for l in lines[-5:]]
-            
-            # Scan all lines for 'nt='
-            for line in lines:
-                if "nt=" in line:
-                    # Example line: "                    nt= 21639"
-                    parts = line.split("nt=")
-                    if len(parts) > 1:
-                        val = parts[1].strip().split()[0]
-                        if val.isdigit():
-                            nt_val = val
-                            # Usually appears early, but we break on first find
-                            break
-            
-        return latest_rlog, ts_str, tail, nt_val
-    except Exception as e:
-        return latest_rlog, "Unknown", [f"Error reading file: {e}"], None
+        with open(f"{fault_dir}/{LOGS_DIR_NAME}/{STATUS_MANIFEST_NAME}", 'r') as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue  # Torn/partial line
+                if isinstance(entry, dict) and entry.get('dir'):
+                    states[os.path.basename(entry['dir'].rstrip("/"))] = entry.get('state')
+    except OSError: pass
+    return states
+
+def atomic_write(path, text):
+    """Writes text to a temp file beside path and renames it over path (new inode)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w') as f: f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
 
 def backup_file(file_path):
-    if not os.path.exists(file_path):
+    # One listing answers both "does it exist" and the highest <name>.<N> backup,
+    # instead of an exists() probe followed by probing N = 1, 2, ...
+    name = os.path.basename(file_path)
+    prefix = name + "."
+    found = False
+    max_i = 0
+    try:
+        with os.scandir(os.path.dirname(file_path) or ".") as it:
+            for e in it:
+                if e.name == name: found = True
+                suffix = e.name[len(prefix):]
+                if e.name.startswith(prefix) and suffix.isdigit(): max_i = max(max_i, int(suffix))
+    except OSError:
         return
-    i = 1
-    while True:
-        backup_path = f"{file_path}.{i}"
-        if not os.path.exists(backup_path):
-            shutil.copy2(file_path, backup_path)
-            print(f"  → Backed up old file to: {os.path.basename(backup_path)}")
-            break
-        i += 1
+    if not found: return
+
+    backup_path = f"{file_path}.{max_i + 1}"
+    # A real copy, not a hardlink: estimates are edited by hand, and editors (or >>)
+    # that write in place would change the backup along with the original.
+    shutil.copy2(file_path, backup_path)
+    print(f"  → Backed up old file to: {os.path.basename(backup_path)}")
+
+def derive_resources(params):
+    """
+    Per-node / per-task numbers both submit paths need, computed once from an
+    estimate: (mem_per_node_mb, total_tasks, maxmem_core).
+    """
+    mem_mb_total = params['mem_gb'] * 1024
+    mem_per_node_mb = max(1024, int(mem_mb_total) // params['nodes'])
+    total_tasks = params['nodes'] * params['tasks_per_node']
+    maxmem_core = int((mem_mb_total / total_tasks) * 0.85)
+    return mem_per_node_mb, total_tasks, maxmem_core
+
+@lru_cache(maxsize=16)
+def _which(prog):
+    return shutil.which(prog) or prog
+
+def run_checked(cmd):
+    """
+    subprocess.run(cmd, check=True) shaped for CPython's posix_spawn fast path:
+    an absolute executable and close_fds=False (nothing here holds fds worth hiding).
+    """
+    return subprocess.run([_which(cmd[0])] + list(cmd[1:]), check=True, close_fds=False)
 
 def submit_via_bash_script(job_path, params, defaults_file):
-    mem_per_node_mb = int((params['mem_gb'] * 1024) / params['nodes'])
-    if mem_per_node_mb < 1024: mem_per_node_mb = 1024
+    mem_per_node_mb = derive_resources(params)[0]
 
     cmd = [
         SUBMIT_BASH_SCRIPT,
@@ -207,38 +419,41 @@ def submit_via_bash_script(job_path, params, defaults_file):
     ]
     print(f"  → calling bash wrapper for Median...")
     try:
-        subprocess.run(cmd, check=True)
+        run_checked(cmd)
     except subprocess.CalledProcessError:
         print("  [ERROR] Bash script submission failed.")
         sys.exit(1)
 
-def submit_array_job(fault_dir, fault_name, valid_dirs, params, defaults_file):
-    logs_dir = os.path.join(fault_dir, "Logs_Submission")
+def prepare_array_job(logs_dir, job_name, targets, params, defaults_file):
+    """
+    Writes the map and env files for one PBS array over every realisation in
+    targets, a list of (fault_name, valid_dirs), and returns its qsub argv.
+    run_emod3d.pbs reads line PBS_ARRAY_INDEX of the map file, so realisations
+    from several faults can share one array as long as they share the same
+    resource request (params).
+    """
     os.makedirs(logs_dir, exist_ok=True)
 
-    map_file = os.path.join(logs_dir, f"{fault_name}_realisations.map")
-    backup_file(map_file)
+    # Map and env files are unique per submission: a queued array reads line
+    # PBS_ARRAY_INDEX of its own map, which a later submission must not replace.
+    stamp = f"{datetime.datetime.now():%Y%m%d_%H%M%S_%f}"
+    map_file = os.path.join(logs_dir, f"{job_name}_realisations_{stamp}.map")
 
-    print(f"  → Targets ({len(valid_dirs)}):")
-    for d in valid_dirs:
-        print(f"      - {os.path.basename(d)}")
+    # Each dir at most once: two subjobs in one realisation would both write LF/OutBin.
+    valid_dirs = list(dict.fromkeys(d for _, dirs in targets for d in dirs))
+    # One write for the whole list rather than a print (and tty flush) per realisation.
+    print(f"  → Targets ({len(valid_dirs)}):\n" + "\n".join(f"      - {os.path.basename(d)}" for d in valid_dirs))
 
-    with open(map_file, 'w') as f:
-        for d in valid_dirs: f.write(f"{d}\n")
+    atomic_write(map_file, "\n".join(valid_dirs) + "\n")
 
     count = len(valid_dirs)
 
     total_mem_gb = params['mem_gb']
-    mem_per_node_mb = int((total_mem_gb * 1024) / params['nodes'])
-    if mem_per_node_mb < 1024: mem_per_node_mb = 1024
+    mem_per_node_mb, total_tasks, maxmem_core = derive_resources(params)
 
     print(f"  → Memory Logic: Total {total_mem_gb}GB / {params['nodes']} Nodes = {mem_per_node_mb}MB per node")
 
-    mem_mb_total = total_mem_gb * 1024
-    total_tasks = params['nodes'] * params['tasks_per_node']
-    maxmem_core = int((mem_mb_total / total_tasks) * 0.85)
-
-    queue = get_queue_name(total_mem_gb, params['walltime'], params['nodes'])
+    queue = get_queue_name(total_mem_gb, params['_walltime_seconds'], params['nodes'])
     print(f"  → Queue Selected: {queue}")
 
     env_vars = [
@@ -246,70 +461,71 @@ def submit_array_job(fault_dir, fault_name, valid_dirs, params, defaults_file):
         f"EMOD3D_BIN={EMOD3D_BIN}",
         f"EMOD3D_DEFAULTS={defaults_file}",
         f"ENABLE_RESTART=no",
-        f"ARRAY_MAP_FILE={map_file}"
     ]
 
+    # Job environment goes in a file that run_emod3d.pbs sources, instead of a
+    # comma-joined -v list (no quoting issues, no -v length limit). ARRAY_MAP_FILE
+    # and a single target's PBS_ARRAY_INDEX stay in -v: check_rlog.sh reads them
+    # from the qstat Variable_List to find the realisation dir.
+    env_file = os.path.join(logs_dir, f"{job_name}_{stamp}.env")
+    qsub_vars = [f"ENV_FILE={env_file}", f"ARRAY_MAP_FILE={map_file}"]
+    env_text = "".join(f"{k}={shlex.quote(v)}\n" for k, v in (e.split("=", 1) for e in env_vars))
+
     resource_list = f"select={params['nodes']}:ncpus={params['tasks_per_node']}:mpiprocs={params['tasks_per_node']}:ompthreads=1:mem={mem_per_node_mb}mb"
 
     if count == 1:
         print(f"  → Single target detected. Submitting as standard job...")
-        env_vars.append("PBS_ARRAY_INDEX=1")
-        qsub_cmd = [
-            "qsub",
-            "-N", f"{fault_name}_Arr",
-            "-q", queue,
-            "-l", resource_list,
-            "-l", f"walltime={params['walltime']}",
-            "-v", ",".join(env_vars),
-            MASTER_PBS_SCRIPT
-        ]
+        qsub_vars.append("PBS_ARRAY_INDEX=1")
+        array_args = []
     else:
-        qsub_cmd = [
-            "qsub",
-            "-N", f"{fault_name}_Arr",
-            "-q", queue,
-            "-l", resource_list,
-            "-l", f"walltime={params['walltime']}",
-            "-J", f"1-{count}",
-            "-v", ",".join(env_vars),
-            MASTER_PBS_SCRIPT
-        ]
+        array_args = ["-J", f"1-{count}"]
+    atomic_write(env_file, env_text)
+
+    qsub_cmd = [
+        "qsub",
+        "-N", f"{job_name}_Arr",
+        "-q", queue,
+        "-l", resource_list,
+        "-l", f"walltime={params['walltime']}",
+        *array_args,
+        "-v", ",".join(qsub_vars),
+        MASTER_PBS_SCRIPT
+    ]
+    return qsub_cmd
 
+def submit_array_job(logs_dir, job_name, targets, params, defaults_file):
+    qsub_cmd = prepare_array_job(logs_dir, job_name, targets, params, defaults_file)
     print(f"  → Submitting...")
-    subprocess.run(qsub_cmd, check=True)
-
-
-def main():
-    parser = argparse.ArgumentParser(description="Submit EMOD3D jobs.")
-    parser.add_argument("fault_name", help="Name of the Fault")
-    parser.add_argument("mode", nargs="?", default="MEDIAN", choices=["MEDIAN", "ALL"])
-    parser.add_argument("--est-yaml", help="Override estimate yaml path.")
-    parser.add_argument("--force", action="store_true", help="Submit jobs even if they appear IN_PROGRESS. Will NOT submit COMPLETED jobs.")
-    parser.add_argument("--re-estimate", action="store_true", help="Re-run estimation.")
-
-    args = parser.parse_args()
-
-    fault_name = args.fault_name
-    fault_dir, runs_root = resolve_paths(fault_name)
+    run_checked(qsub_cmd)
 
-    project_root = os.path.dirname(runs_root)
-    defaults_file = os.path.join(project_root, DEFAULTS_YAML_NAME)
-
-    if not os.path.exists(defaults_file):
-        print(f"CRITICAL ERROR: Defaults file missing: {defaults_file}")
-        sys.exit(1)
 
+def get_estimate(fault_name, fault_dir, args):
+    """Returns (params, estimate_yaml_path) from --est-yaml, a fresh estimate, or the saved one."""
     estimate_yaml_path = os.path.join(fault_dir, "emod3d_estimate.yaml")
-    params = None
-
+    stale = None  # The outdated saved estimate, if that is why we re-estimate
     if args.est_yaml:
-        with open(args.est_yaml, 'r') as f: 
-            params = yaml.safe_load(f)
-            sanitize_params(params)
+        params = load_yaml_params(args.est_yaml)
     
-    elif args.re_estimate or not os.path.exists(estimate_yaml_path):
-        new_params = exec_estimation_script(fault_name)
-        sanitize_params(new_params)
+    elif not args.re_estimate and os.path.exists(estimate_yaml_path):
+        print(f"  → Loading existing estimate: {estimate_yaml_path}")
+        params = load_yaml_params(estimate_yaml_path)
+        # Estimates written before source_mtime existed are trusted as-is.
+        saved_mtime = params.get('source_mtime')
+        current_mtime = inputs_mtime(fault_name) if saved_mtime is not None else None
+        if current_mtime is not None and current_mtime != saved_mtime:
+            print(f"  [stale] Inputs for {fault_name} changed since the estimate was written; re-estimating.")
+            stale, params = params, None
+    else:
+        params = None
+
+    if params is None:
+        try:
+            new_params = exec_estimation_script(fault_name)
+        except SystemExit:
+            # The estimator reports its own error and exits; a stale estimate still beats none.
+            if stale is None: raise
+            print(f"  [WARN] Re-estimation failed; using the saved estimate: {estimate_yaml_path}")
+            return stale, estimate_yaml_path
 
         print("\n  ---------------------------------")
         print(f"  New Estimation for {fault_name}:")
@@ -319,17 +535,181 @@ def main():
         print(f"    Time:  {new_params['walltime']}")
         print("  ---------------------------------")
 
-        if os.path.exists(estimate_yaml_path) and args.re_estimate:
-            backup_file(estimate_yaml_path)
-        
+        # Inputs shared by every fault (root_params.yaml) can mark an estimate stale;
+        # don't let that silently drop a walltime the user raised (--re-estimate does).
+        if stale and (stale['_walltime_seconds'] or 0) > (new_params['_walltime_seconds'] or 0):
+            set_walltime(new_params, stale['walltime'])
+            if 'comment' in stale: new_params['comment'] = stale['comment']
+            print(f"  → Keeping the saved walltime {stale['walltime']} (higher than the new estimate; use --re-estimate to drop it)")
+
+        backup_file(estimate_yaml_path)  # No-op if there is no previous estimate
         save_estimation_yaml(new_params, estimate_yaml_path)
         params = new_params
 
+    return params, estimate_yaml_path
+
+def list_realisations(fault_dir, fault_name):
+    """Sorted {fault_name}_REL* directory paths under fault_dir."""
+    # One scandir pass; DirEntry caches the type so no extra stat per realisation.
+    prefix = f"{fault_name}_REL"
+    with os.scandir(fault_dir) as it:
+        return sorted(e.path for e in it if e.name.startswith(prefix) and e.is_dir())
+
+# "1-3,5" -> ("1","3"), ("5","")
+_SELECTION_RE = re.compile(r'(\d+)\s*(?:-\s*(\d+))?')
+
+def parse_selection(text, count):
+    """1-based indices picked by a "1-3,5" style string (or "all"), clipped to 1..count."""
+    if text.strip().lower() in ("a", "all"): return set(range(1, count + 1))
+    picked = set()
+    for lo, hi in _SELECTION_RE.findall(text):
+        picked.update(range(int(lo), int(hi or lo) + 1))
+    return {i for i in picked if 1 <= i <= count}
+
+def collect_realisations(fault_dir, fault_name, params, estimate_yaml_path, force):
+    """
+    Returns the {fault_name}_REL* dirs to submit: NEW ones, plus IN_PROGRESS ones
+    the user confirms under --force. COMPLETED ones are always skipped.
+    """
+    all_dirs = list_realisations(fault_dir, fault_name)
+
+    print(f"Scanning {len(all_dirs)} realisations...")
+
+    # Realisations the manifest records as COMPLETED only need their rlog dir
+    # confirmed (a wiped LF/ means a rerun); everything else is probed as before.
+    manifest = load_status_manifest(fault_dir)
+    to_probe = [d for d in all_dirs
+                if manifest.get(os.path.basename(d)) != "COMPLETED" or not os.path.isdir(f"{d}/{RLOG_SUBDIR}")]
+    # With --force the same pass also collects what the IN_PROGRESS table shows.
+    inspect = lambda d: inspect_run(d, details=force)
+    workers = min(STATUS_WORKERS, len(to_probe))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            probed = dict(zip(to_probe, ex.map(inspect, to_probe)))
     else:
-        print(f"  → Loading existing estimate: {estimate_yaml_path}")
-        with open(estimate_yaml_path, 'r') as f: 
-            params = yaml.safe_load(f)
-            sanitize_params(params)
+        probed = {d: inspect(d) for d in to_probe}
+    done = ("COMPLETED", None, None, [], None)
+
+    valid_dirs = []
+    in_progress = []  # (dir, rlog, rtime, rlines, nt) shown in one table under --force
+    for d in all_dirs:
+        status, rlog, rtime, rlines, nt_val = probed.get(d, done)
+        # Requirement: Skip completed even if forced
+        if status == "NEW": valid_dirs.append(d)  # Always submit NEW jobs
+        elif status == "IN_PROGRESS" and force: in_progress.append((d, rlog, rtime, rlines, nt_val))
+
+    if not in_progress: return valid_dirs
+
+    print(f"\n  [WARN] {len(in_progress)} realisation(s) are IN_PROGRESS but --force is active:")
+    for i, (d, rlog, rtime, rlines, nt_val) in enumerate(in_progress, 1):
+        print(f"\n  {i:>3}) {os.path.basename(d)}")
+        if rlog:
+            print(f"         Rlog: {os.path.basename(rlog)}")
+            print(f"         Modified: {rtime}")
+            if nt_val:
+                print(f"         Simulation steps (nt): {nt_val}")
+            print(f"         Last lines:")
+            for l in rlines:
+                print(f"           | {l}")
+        else:
+            print("         (Status IN_PROGRESS but valid rlog not found?)")
+
+    # One selection and at most one walltime prompt (and YAML write) for the whole batch.
+    try:
+        user_input = input(f"\n  > Resubmit which? (e.g. 1-3,5 or 'all'; Enter for none): ")
+        picked = parse_selection(user_input, len(in_progress))
+        if not picked:
+            print("  > Skipped.")
+            return valid_dirs
+
+        resubmit = {in_progress[i - 1][0] for i in picked}
+        print(f"  > Marked for resubmission: {', '.join(os.path.basename(d) for d, *_ in in_progress if d in resubmit)}")
+        valid_dirs = [d for d in all_dirs if d in resubmit or d in valid_dirs]
+
+        # Ask for walltime update
+        current_wall = params.get('walltime', 'Unknown')
+        print(f"  > Current walltime estimate is: {current_wall}")
+        wt_input = input(f"  > Do you want to increase the walltime? (Enter new HH:MM:SS or Press Enter to keep): ")
+        if wt_input.strip():
+            set_walltime(params, wt_input.strip())
+            # Update yaml
+            params['comment'] = f"Walltime updated manually by user on {datetime.datetime.now()}"
+            save_estimation_yaml(params, estimate_yaml_path)
+            print(f"  > Updated {os.path.basename(estimate_yaml_path)} with new walltime: {params['walltime']}")
+    except EOFError:
+        print("  > Non-interactive input detected. Skipping.")
+
+    return valid_dirs
+
+def union_params(params_list):
+    """
+    Smallest single request that covers every estimate: max nodes, tasks per node
+    and walltime, with enough total memory for the largest per-node requirement.
+    """
+    nodes = max(p['nodes'] for p in params_list)
+    return sanitize_params({
+        'nodes': nodes,
+        'tasks_per_node': max(p['tasks_per_node'] for p in params_list),
+        'mem_gb': max(-(-p['mem_gb'] * nodes // p['nodes']) for p in params_list),  # ceil-div
+        'walltime': max(p['_walltime_seconds'] or 0 for p in params_list),
+    })
+
+def submit_fault_list(args):
+    """
+    ALL mode over every fault in --fault-list. Faults whose estimates request
+    identical resources share one PBS array (one qsub) with a combined map file;
+    --single-array merges everything into one array sized by union_params().
+    """
+    with open(args.fault_list, 'r') as f:
+        # Duplicates dropped (order kept): a repeated fault would put two subjobs in each of its dirs.
+        fault_names = list(dict.fromkeys(l.strip() for l in f if l.strip() and not l.lstrip().startswith("#")))
+    if not fault_names:
+        print(f"Error: No fault names found in {args.fault_list}")
+        sys.exit(1)
+
+    runs_root, faults = resolve_faults(fault_names)
+    if len(faults) != len(fault_names): sys.exit(1)
+    defaults_file = get_defaults_file(runs_root)
+
+    # (nodes, tasks_per_node, mem_gb, walltime) -> (params, [(fault_name, valid_dirs)])
+    groups = {}
+    for fault_name, fault_dir in faults:
+        print(f"\n=== {fault_name} ===")
+        params, estimate_yaml_path = get_estimate(fault_name, fault_dir, args)
+        valid_dirs = collect_realisations(fault_dir, fault_name, params, estimate_yaml_path, args.force)
+        if not valid_dirs: continue
+
+        key = (params['nodes'], params['tasks_per_node'], params['mem_gb'], params['walltime'])
+        groups.setdefault(key, (params, []))[1].append((fault_name, valid_dirs))
+
+    if not groups:
+        print("\n  ✓ All realisations finished or running (and none forced to resubmit).")
+        return
+
+    if args.single_array and len(groups) > 1:
+        # One qsub for everything, sized for the most demanding fault.
+        merged = union_params([params for params, _ in groups.values()])
+        groups = {None: (merged, [t for _, targets in groups.values() for t in targets])}
+        print(f"\n  → --single-array: {merged['nodes']} nodes x {merged['tasks_per_node']} tasks, {merged['mem_gb']} GB, {merged['walltime']} for all faults")
+
+    logs_dir = f"{runs_root}/{LOGS_DIR_NAME}"
+    list_name = os.path.splitext(os.path.basename(args.fault_list))[0]
+    qsub_cmds = []
+    for params, targets in groups.values():
+        # Named after the group's first fault (each fault is in exactly one group),
+        # not its position, so a name means the same faults from run to run.
+        job_name = list_name if len(groups) == 1 else f"{list_name}_{targets[0][0]}"
+        print(f"\n=== Array {job_name}: {', '.join(name for name, _ in targets)} ===")
+        qsub_cmds.append(prepare_array_job(logs_dir, job_name, targets, params, defaults_file))
+
+    # Remaining distinct arrays are submitted concurrently, a few qsub calls at a time.
+    print(f"\n  → Submitting {len(qsub_cmds)} array(s)...")
+    with ThreadPoolExecutor(max_workers=QSUB_WORKERS) as ex:
+        list(ex.map(run_checked, qsub_cmds))
+
+def submit_fault(fault_name, fault_dir, defaults_file, args):
+    """MEDIAN or ALL submission for one fault."""
+    params, estimate_yaml_path = get_estimate(fault_name, fault_dir, args)
 
     if args.mode == "MEDIAN":
         median_dir = os.path.join(fault_dir, fault_name)
@@ -347,73 +727,46 @@ def main():
                 print(f"  [SKIP] Median job status: {status}")
 
     elif args.mode == "ALL":
-        search_pattern = os.path.join(fault_dir, f"{fault_name}_REL*")
-        all_dirs = sorted(glob.glob(search_pattern))
-        valid_dirs = []
-
-        print(f"Scanning {len(all_dirs)} realisations...")
-
-        for d in all_dirs:
-            if not os.path.isdir(d): continue
-            status = get_run_status(d)
-            rel_name = os.path.basename(d)
-
-            if status == "COMPLETED":
-                # Requirement: Skip completed even if forced
-                # print(f"  - {rel_name}: COMPLETED")
-                continue
-
-            if status == "NEW":
-                # Always submit NEW jobs
-                valid_dirs.append(d)
-                continue
-
-            # Handle IN_PROGRESS
-            if status == "IN_PROGRESS":
-                if args.force:
-                    rlog, rtime, rlines, nt_val = get_rlog_details(d)
-                    print(f"\n  [WARN] Job {rel_name} is IN_PROGRESS but --force is active.")
-                    if rlog:
-                        print(f"         Rlog: {os.path.basename(rlog)}")
-                        print(f"         Modified: {rtime}")
-                        if nt_val:
-                            print(f"         Simulation steps (nt): {nt_val}")
-                        print(f"         Last lines:")
-                        for l in rlines:
-                            print(f"           | {l}")
-                    else:
-                        print("         (Status IN_PROGRESS but valid rlog not found?)")
-                    
-                    # Interactive confirmation
-                    try:
-                        user_input = input(f"         > Resubmit {rel_name}? (y/N): ")
-                        if user_input.lower().strip() == 'y':
-                            valid_dirs.append(d)
-                            print("         > Marked for resubmission.")
-                            
-                            # Ask for walltime update
-                            current_wall = params.get('walltime', 'Unknown')
-                            print(f"         > Current walltime estimate is: {current_wall}")
-                            wt_input = input(f"         > Do you want to increase the walltime? (Enter new HH:MM:SS or Press Enter to keep): ")
-                            if wt_input.strip():
-                                params['walltime'] = wt_input.strip()
-                                sanitize_params(params)
-                                # Update yaml
-                                params['comment'] = f"Walltime updated manually by user on {datetime.datetime.now()}"
-                                save_estimation_yaml(params, estimate_yaml_path)
-                                print(f"         > Updated {os.path.basename(estimate_yaml_path)} with new walltime: {params['walltime']}")
-                        else:
-                            print("         > Skipped.")
-                    except EOFError:
-                        print("         > Non-interactive input detected. Skipping.")
-                else:
-                    # print(f"  - {rel_name}: IN_PROGRESS (Skip)")
-                    pass
+        valid_dirs = collect_realisations(fault_dir, fault_name, params, estimate_yaml_path, args.force)
 
         if not valid_dirs:
             print("  ✓ All realisations finished or running (and none forced to resubmit).")
         else:
-            submit_array_job(fault_dir, fault_name, valid_dirs, params, defaults_file)
+            submit_array_job(f"{fault_dir}/{LOGS_DIR_NAME}", fault_name, [(fault_name, valid_dirs)], params, defaults_file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Submit EMOD3D jobs.")
+    parser.add_argument("fault_names", nargs="*", metavar="fault_name", help="Name of the Fault (several may be given), optionally followed by the mode: MEDIAN (default) or ALL")
+    parser.add_argument("--est-yaml", help="Override estimate yaml path.")
+    parser.add_argument("--force", action="store_true", help="Submit jobs even if they appear IN_PROGRESS. Will NOT submit COMPLETED jobs.")
+    parser.add_argument("--re-estimate", action="store_true", help="Re-run estimation.")
+    parser.add_argument("--fault-list", "--faults-file", help="File with one fault name per line; submits ALL realisations of every fault, batched into shared arrays.")
+    parser.add_argument("--single-array", action="store_true", help="With --fault-list, submit one array for all faults sized for the largest estimate.")
+
+    args = parser.parse_args()
+    # The mode stays a trailing positional ("F1 ALL") after any number of fault names.
+    args.mode = args.fault_names.pop() if args.fault_names and args.fault_names[-1] in MODES else "MEDIAN"
+    # A mis-cased mode ("all") must not be taken for a fault name and fall back to MEDIAN.
+    if args.fault_names and args.fault_names[-1].upper() in MODES:
+        parser.error(f"invalid mode '{args.fault_names[-1]}' (choose from {', '.join(MODES)})")
+
+    if args.single_array and not args.fault_list: parser.error("--single-array requires --fault-list")
+    if args.fault_list:
+        if args.fault_names: parser.error("--fault-list replaces the fault name (and always runs ALL mode)")
+        submit_fault_list(args)
+        return
+    if not args.fault_names: parser.error("fault_name is required unless --fault-list is given")
+    # "F2 F2 ALL" would otherwise submit two arrays over the same realisations.
+    args.fault_names = list(dict.fromkeys(args.fault_names))
+
+    # Every name is resolved before anything is submitted; one unknown fault aborts the run.
+    runs_root, faults = resolve_faults(args.fault_names)
+    if len(faults) != len(args.fault_names): sys.exit(1)
+    defaults_file = get_defaults_file(runs_root)
+
+    for fault_name, fault_dir in faults:
+        if len(faults) > 1: print(f"\n=== {fault_name} ===")
+        submit_fault(fault_name, fault_dir, defaults_file, args)
 
 if __name__ == "__main__":
     main()